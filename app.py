@@ -1,10 +1,19 @@
 import streamlit as st
+import streamlit.components.v1 as components
 import pandas as pd
-from datetime import datetime, timedelta, date 
+import numpy as np
+from datetime import datetime, timedelta, date
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
+from pathlib import Path
 from entsoe import EntsoePandasClient
 import plotly.graph_objects as go
-import plotly.express as px
+import plotly.io as pio
 import base64
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter, Retry
 
 # --- Streamlit Page Configuration ---
 st.set_page_config(
@@ -13,8 +22,9 @@ st.set_page_config(
     initial_sidebar_state="expanded" # Expands the sidebar automatically
 )
 
-# Function to load and encode a local image
-@st.cache_data
+# Function to load and encode a local image; cache_resource stores the string
+# by reference, skipping cache_data's pickle round-trip on every rerun
+@st.cache_resource
 def get_img_as_base64(file):
     with open(file, "rb") as f:
         data = f.read()
@@ -55,63 +65,252 @@ except KeyError:
     st.error("ENTSPE API token not found in `.streamlit/secrets.toml`. Please create the file and add the 'entsoe_token' key.")
     st.stop() # Stop app execution if token is not available
 
-client = EntsoePandasClient(api_key=token)
+# One ENTSOE client per token for the process lifetime. Its session gets an
+# HTTPAdapter with pooled connections and retries, so the concurrent
+# per-country queries reuse keep-alive sockets instead of paying a TLS
+# handshake each time.
+@st.cache_resource
+def get_client(_api_token):
+    # Underscore prefix keeps the token out of the cache-key hashing; the app
+    # only ever runs with the single token from secrets
+    session = requests.Session()
+    session.mount("https://", HTTPAdapter(
+        pool_connections=32,
+        pool_maxsize=32,
+        max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[502, 503, 504])
+    ))
+    client = EntsoePandasClient(api_key=_api_token)
+    client.session = session
+    return client
 
 if 'cache_buster' not in st.session_state:
     st.session_state.cache_buster = 0
 
-# --- Data Fetching Function (with caching) ---
-@st.cache_data(ttl=3600)
-def get_entsoe_data(selected_day_dt, selected_countries, api_token, resolution_code_entsoe, cache_buster):
+# --- Data Fetching Functions (with caching) ---
+@lru_cache(maxsize=64)
+def _day_bounds(selected_day_dt):
+    """Start/end timestamps for one market day; Timestamps are immutable, so the
+    cached pair is safely shared by all worker threads."""
+    start_ts = pd.Timestamp(selected_day_dt, tz='Europe/Brussels')
+    end_ts = pd.Timestamp(selected_day_dt + timedelta(days=1), tz='Europe/Brussels')
+    return start_ts, end_ts
+
+@lru_cache(maxsize=64)
+def _expected_index(selected_day_dt, freq):
+    """Expected time grid for one market day at the given frequency; building a
+    tz-aware date_range is disproportionately expensive to repeat per rerun."""
+    start_ts, end_ts = _day_bounds(selected_day_dt)
+    return pd.date_range(start=start_ts, end=end_ts, freq=freq, inclusive='left', tz='Europe/Brussels')
+
+# On-disk cache so already-downloaded days survive process restarts; entries
+# are best-effort and safe to delete at any time.
+_DISK_CACHE_DIR = Path(".cache/entsoe")
+
+def _disk_cache_path(selected_day_dt, country, resolution_api):
+    return _DISK_CACHE_DIR / f"{country}_{selected_day_dt:%Y%m%d}_{resolution_api}.parquet"
+
+def _query_prices(selected_day_dt, country, resolution_api):
+    """Runs a single day-ahead price query against ENTSOE for one country,
+    backed by the on-disk parquet cache."""
+    cache_path = _disk_cache_path(selected_day_dt, country, resolution_api)
+    if cache_path.exists():
+        # Historical days are immutable; today/tomorrow files are only trusted
+        # for the recent TTL (based on file modification time).
+        is_fresh = (selected_day_dt < datetime.now().date()
+                    or time.time() - cache_path.stat().st_mtime < _RECENT_TTL_SECONDS)
+        if is_fresh:
+            try:
+                return pd.read_parquet(cache_path).iloc[:, 0]
+            except Exception:
+                pass # Unreadable cache file; fall through to the network
+
+    # The token comes from module scope so it never ends up in a cache key
+    client_local = get_client(token)
+
+    start_ts, end_ts = _day_bounds(selected_day_dt)
+
+    price_series = client_local.query_day_ahead_prices(
+        country_code=country,
+        start=start_ts,
+        end=end_ts,
+        resolution=resolution_api
+    )
+
+    if price_series is not None and not price_series.empty:
+        try:
+            _DISK_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+            price_series.to_frame("price").to_parquet(cache_path)
+        except Exception:
+            pass # Caching is best-effort; never fail the fetch over it
+
+    return price_series
+
+# The caches are keyed per (day, country), so changing the multiselect only
+# fetches countries not seen before instead of invalidating the whole payload.
+# Historical days are immutable and cached without expiry. Prices for
+# today/tomorrow may still be published or corrected, so they get
+# stale-while-revalidate semantics: entries past their TTL are served
+# immediately while a background thread refreshes them, and the next rerun
+# picks up the fresh data — the UI never blocks on an expired cache.
+_RECENT_TTL_SECONDS = 3600
+_swr_lock = threading.Lock()
+_swr_store = {}       # key -> (fetched_at, price_series)
+_swr_refreshing = set()
+
+def _swr_refresh(key, selected_day_dt, country, resolution_api):
+    try:
+        price_series = _query_prices(selected_day_dt, country, resolution_api)
+        with _swr_lock:
+            _swr_store[key] = (time.time(), price_series)
+    except Exception:
+        pass # Keep serving the stale entry; the next expiry will retry
+    finally:
+        with _swr_lock:
+            _swr_refreshing.discard(key)
+
+def _fetch_one_recent(selected_day_dt, country, resolution_api, cache_buster):
+    key = (selected_day_dt, country, resolution_api, cache_buster)
+    with _swr_lock:
+        entry = _swr_store.get(key)
+
+    if entry is None:
+        # First request for this key has nothing to serve, so it must block
+        price_series = _query_prices(selected_day_dt, country, resolution_api)
+        with _swr_lock:
+            _swr_store[key] = (time.time(), price_series)
+        return price_series
+
+    fetched_at, price_series = entry
+    if time.time() - fetched_at > _RECENT_TTL_SECONDS:
+        with _swr_lock:
+            if key not in _swr_refreshing:
+                _swr_refreshing.add(key)
+                threading.Thread(
+                    target=_swr_refresh,
+                    args=(key, selected_day_dt, country, resolution_api),
+                    daemon=True
+                ).start()
+    return price_series
+
+@st.cache_data(ttl=None, show_spinner=False)
+def _fetch_one_historical(selected_day_dt, country, resolution_api, cache_buster):
+    return _query_prices(selected_day_dt, country, resolution_api)
+
+def _data_fingerprint(df):
+    """Cheap digest of a frame's contents. Today/tomorrow prices can change
+    under an unchanged selection (stale-while-revalidate refresh), so cached
+    figures must be keyed on the data itself, not just the query inputs."""
+    if df.empty:
+        return 0
+    return int(pd.util.hash_pandas_object(df, index=True).sum())
+
+def get_entsoe_data(selected_day_dt, selected_countries, resolution_code_entsoe, cache_buster):
     """
     Fetches day-ahead electricity price data from ENTSOE for a selected day with a given resolution.
+    Orchestrates the per-country cached fetches and assembles them into one DataFrame.
     Returns a DataFrame, a list of countries for which data could not be fetched, and a list of status messages.
     """
-    client_local = EntsoePandasClient(api_key=api_token)
-    final_df_cached = pd.DataFrame()
     failed_countries_list = []
     status_messages = [] # List for status messages
 
-    start_ts = pd.Timestamp(selected_day_dt, tz='Europe/Brussels')
-    end_ts = pd.Timestamp(selected_day_dt + timedelta(days=1), tz='Europe/Brussels')
+    start_ts, end_ts = _day_bounds(selected_day_dt)
 
     translated_resolution_for_api = resolution_code_entsoe
     if resolution_code_entsoe == "PT60M":
         translated_resolution_for_api = "60min"
     elif resolution_code_entsoe == "PT15M":
         translated_resolution_for_api = "15min"
-    
-    for country in selected_countries:
-        status_messages.append(f"Fetching data for **{country}** ({translated_resolution_for_api})...")
-        try:
-            price_series = client_local.query_day_ahead_prices(
-                country_code=country,
-                start=start_ts,
-                end=end_ts,
-                resolution=translated_resolution_for_api
-            )
 
-            if price_series is None or price_series.empty:
-                status_messages.append(f"⚠️ Data for **{country}** not available for {selected_day_dt.strftime('%Y-%m-%d')} with {translated_resolution_for_api} resolution.")
+    fetch_one = _fetch_one_historical if selected_day_dt < datetime.now().date() else _fetch_one_recent
+
+    # The per-country queries are independent HTTPS round-trips, so issue them
+    # concurrently instead of waiting for each country in turn.
+    series_dict = {}
+    with ThreadPoolExecutor(max_workers=min(16, len(selected_countries))) as executor:
+        future_to_country = {}
+        for country in selected_countries:
+            status_messages.append(f"Fetching data for **{country}** ({translated_resolution_for_api})...")
+            future = executor.submit(
+                fetch_one,
+                selected_day_dt,
+                country,
+                translated_resolution_for_api,
+                cache_buster
+            )
+            future_to_country[future] = country
+
+        # Futures finish in arbitrary order; collect the outcomes per country
+        # and report them in the order of the user's selection.
+        result_messages = {}
+        for future in as_completed(future_to_country):
+            country = future_to_country[future]
+            try:
+                price_series = future.result()
+
+                if price_series is None or price_series.empty:
+                    result_messages[country] = f"⚠️ Data for **{country}** not available for {selected_day_dt.strftime('%Y-%m-%d')} with {translated_resolution_for_api} resolution."
+                else:
+                    series_dict[country] = price_series
+                    result_messages[country] = f"✅ Data for **{country}** fetched successfully."
+
+            except Exception as e:
+                result_messages[country] = f"❌ Error fetching data for **{country}** with {translated_resolution_for_api} resolution – {e}"
+
+        for country in selected_countries:
+            status_messages.append(result_messages[country])
+            if country not in series_dict:
                 failed_countries_list.append(country)
-            else:
-                final_df_cached[country] = price_series
-                status_messages.append(f"✅ Data for **{country}** fetched successfully.")
 
-        except Exception as e:
-            status_messages.append(f"❌ Error fetching data for **{country}** with {translated_resolution_for_api} resolution – {e}")
-            failed_countries_list.append(country)
-            
-    if not final_df_cached.empty:
-        expected_freq = 'h' if resolution_code_entsoe == 'PT60M' else '15min'
-        expected_index = pd.date_range(start=start_ts, end=end_ts, freq=expected_freq, inclusive='left', tz='Europe/Brussels')
-        
-        final_df_cached.index = final_df_cached.index.tz_convert('Europe/Brussels')
-        final_df_cached = final_df_cached.reindex(expected_index)
+    if series_dict:
+        # Assemble the frame in one go, keeping the column order of the selection.
+        final_df_cached = pd.concat(series_dict, axis=1)
+        final_df_cached = final_df_cached.reindex(columns=[c for c in selected_countries if c in series_dict])
 
+        expected_freq = 'h' if resolution_code_entsoe == 'PT60M' else '15min'
+        expected_index = _expected_index(selected_day_dt, expected_freq)
+
+        # Both normalizations allocate a new index/frame, so skip them when the
+        # data already comes back in the expected shape (the common case)
+        if str(final_df_cached.index.tz) != 'Europe/Brussels':
+            final_df_cached.index = final_df_cached.index.tz_convert('Europe/Brussels')
+        if not final_df_cached.index.equals(expected_index):
+            final_df_cached = final_df_cached.reindex(expected_index)
+        # Consolidate into a single float64 block so later to_numpy(copy=False)
+        # calls hand out views instead of consolidation copies
+        final_df_cached = final_df_cached.astype(np.float64, copy=False)
+    else:
+        final_df_cached = pd.DataFrame()
 
     return final_df_cached, failed_countries_list, status_messages
 
+# Static widget option collections and colorscale metadata, built once
+RESOLUTION_DISPLAY_OPTIONS = {
+    "Hourly": "PT60M",
+    "15 minutes": "PT15M"
+}
+
+ALL_COUNTRIES = ("CZ", "PL", "DE_LU", "FR", "SK", "DK_1", "SE_4", "ES", "AT", "IT_NORD", "NO_3", "HU", "HR", "SI", "BE", "NL", "PT", "IE_SEM", "LT", "LV", "EE", "GR", "FI", "BG", "RO", "CH", "LU")
+DEFAULT_COUNTRIES = ("CZ", "DE_LU", "SK", "PL", "AT", "FR")
+
+COLORSCALE_OPTIONS = ("Default", "Picnic", "balance", "Temps", "Fall", "Tropic", "Portland", "Earth", "PRGn", "RdBu", "Viridis", "ice", "deep", "dense", "gray", "hot", "jet", "cividis", "RdBu", "YlGnBu", "YlOrRd", "haline")
+DIVERGING_SCALES = frozenset({"Default", "Picnic", "PRGn", "RdBu", "balance", "Temps"})
+
+def _compute_zrange(data_zmin, data_zmax, diverging):
+    """Color range (zmin, zmax, zmid) for the heatmap from the data extremes.
+
+    Diverging scales with mixed-sign data are centered symmetrically on zero;
+    otherwise the range is anchored at zero on the side the data leaves free.
+    """
+    if diverging and data_zmin < 0 < data_zmax:
+        max_abs_val = max(-data_zmin, data_zmax)
+        return -max_abs_val, max_abs_val, 0
+    if data_zmin >= 0: # All positive, start from 0 for better visualization
+        return 0, data_zmax, None
+    if data_zmax <= 0: # All negative, end at 0
+        return data_zmin, 0, None
+    # Mixed data on a sequential scale is not ideal, but retain the full range
+    return data_zmin, data_zmax, None
+
 # --- Sidebar Parameters ---
 with st.sidebar:
     st.header("Query Parameters")
@@ -131,27 +330,21 @@ with st.sidebar:
 
     if selected_day_input >= RESOLUTION_CHANGE_DATE:
         st.subheader("Data Resolution")
-        resolution_display_options = {
-            "Hourly": "PT60M",
-            "15 minutes": "PT15M"
-        }
         selected_resolution_display_name = st.radio(
             "Choose time resolution for data:",
-            options=list(resolution_display_options.keys()),
+            options=list(RESOLUTION_DISPLAY_OPTIONS.keys()),
             index=1, # Default to "Hourly"
             key="resolution_selector"
         )
-        selected_resolution_entsoe_code = resolution_display_options[selected_resolution_display_name]
+        selected_resolution_entsoe_code = RESOLUTION_DISPLAY_OPTIONS[selected_resolution_display_name]
     else:
         st.info(f"For data before {RESOLUTION_CHANGE_DATE.strftime('%d.%m.%Y')}, only hourly resolution is available.")
         # selected_resolution_entsoe_code is already "PT60M" from default setting, no change needed
 
-    all_countries = ["CZ", "PL", "DE_LU", "FR", "SK", "DK_1", "SE_4", "ES", "AT", "IT_NORD", "NO_3", "HU", "HR", "SI", "BE", "NL", "PT", "IE_SEM", "LT", "LV", "EE", "GR", "FI", "BG", "RO", "CH", "LU"]
-
     selected_countries = st.multiselect(
         "Select Countries",
-        options=all_countries,
-        default=["CZ", "DE_LU", "SK", "PL", "AT", "FR",]
+        options=ALL_COUNTRIES,
+        default=DEFAULT_COUNTRIES
     )
 
     if not selected_countries:
@@ -170,133 +363,65 @@ GLOBAL_FONT_FAMILY = "Arial"
 GLOBAL_FONT_SIZE = 18
 GLOBAL_FONT_COLOR = "black"
 
-resolution_text = "15-minute" if selected_resolution_entsoe_code == "PT15M" else "hourly"
-
-final_df = pd.DataFrame() # Initialize an empty DataFrame
-failed_countries = []
-messages_from_fetch = []
-
-# Single status box for all data loading
-with st.status(f"Loading {resolution_text} day-ahead prices for {selected_day_input.strftime('%Y-%m-%d')}...", expanded=False) as status:
-    # Call the cached function
-    final_df, failed_countries, messages_from_fetch = get_entsoe_data(
-        selected_day_input, 
-        selected_countries, 
-        token, 
-        selected_resolution_entsoe_code, 
-        st.session_state.cache_buster
-    )
-
-    # Display individual messages from the fetching process
-    for msg in messages_from_fetch:
-        status.write(msg)
-    
-    # Update the final state of the status box
-    if failed_countries:
-        status.update(label=f"Data loading completed with issues for {len(failed_countries)} countries. ⚠️", state="error", expanded=True)
-    else:
-        status.update(label=f"Data loading completed for all selected countries. ✅", state="complete", expanded=False)
-
-# After data loading is complete (or errors displayed via status box), proceed with visualization
-if not final_df.empty:
-    # --- LINE CHART SECTION (DEFAULT ON, NO CHECKBOX) ---
-    st.markdown("---") 
-    st.subheader(f"Day-Ahead Price Line Chart ({resolution_text} resolution)")
-
-    df_line = final_df.copy()
-    df_line.index.name = "Time" 
-    df_line_melted = df_line.reset_index().melt(id_vars="Time", var_name="Country", value_name="Price [€/MWh]")
-
-    fig_line = px.line(
-        df_line_melted,
-        x="Time",
-        y="Price [€/MWh]",
-        color="Country",
-        line_shape="hv", 
-        title=f"Day-Ahead Electricity Price Curves for {selected_day_input.strftime('%Y-%m-%d')} ({'15 min' if selected_resolution_entsoe_code == 'PT15M' else 'hourly'})",
-        labels={"Time": "Time", "Price [€/MWh]": "Price [€/MWh]", "Country": "Countries"},
-        height=600
+# Invariant Plotly layout fragments, built once instead of re-allocating the
+# same small dicts inside update_layout on every rerun
+FONT_SMALL = dict(family=GLOBAL_FONT_FAMILY, size=GLOBAL_FONT_SIZE * 0.9, color=GLOBAL_FONT_COLOR)
+FONT_BASE = dict(family=GLOBAL_FONT_FAMILY, size=GLOBAL_FONT_SIZE, color=GLOBAL_FONT_COLOR)
+FONT_AXIS_TITLE = dict(family=GLOBAL_FONT_FAMILY, size=GLOBAL_FONT_SIZE * 1.05, color=GLOBAL_FONT_COLOR)
+FONT_LARGE = dict(family=GLOBAL_FONT_FAMILY, size=GLOBAL_FONT_SIZE * 1.1, color=GLOBAL_FONT_COLOR)
+WATERMARK_ANNOTATIONS = [dict(
+    x=1,
+    y=1.05,
+    xref="paper",
+    yref="paper",
+    text="PattPet",
+    showarrow=False,
+    font=dict(size=GLOBAL_FONT_SIZE * 0.7, color="grey", family=GLOBAL_FONT_FAMILY),
+    align="right",
+    borderpad=4
     )
+]
 
-    fig_line.update_traces(line=dict(width=2.2)) 
-
-    # Apply custom hovertemplate to each trace
-    for trace in fig_line.data:
-        trace.hovertemplate = '<b>Country: %{fullData.name}</b><br>Time: %{x|%H:%M}<br>Price: %{y:.2f} €/MWh<extra></extra>'
-
+resolution_text = "15-minute" if selected_resolution_entsoe_code == "PT15M" else "hourly"
 
-    fig_line.update_layout(
-        hovermode='x unified', # Setting for "table of all values"
-        font=dict(family=GLOBAL_FONT_FAMILY, size=GLOBAL_FONT_SIZE * 0.9, color=GLOBAL_FONT_COLOR),
-        plot_bgcolor='white',
-        paper_bgcolor='white',
-        xaxis=dict(
-            title_font=dict(color=GLOBAL_FONT_COLOR, size=GLOBAL_FONT_SIZE * 1.05, family=GLOBAL_FONT_FAMILY),
-            tickfont=dict(color=GLOBAL_FONT_COLOR, size=GLOBAL_FONT_SIZE * 0.9, family=GLOBAL_FONT_FAMILY),
-            linecolor=GLOBAL_FONT_COLOR,
-            gridcolor="lightgray",
-            title = None, # Remove X-axis title "Time", it's clear enough
-            
-        ),
-        yaxis=dict(
-            title_font=dict(color=GLOBAL_FONT_COLOR, size=GLOBAL_FONT_SIZE * 1.05, family=GLOBAL_FONT_FAMILY),
-            tickfont=dict(color=GLOBAL_FONT_COLOR, size=GLOBAL_FONT_SIZE * 0.9, family=GLOBAL_FONT_FAMILY),
-            linecolor=GLOBAL_FONT_COLOR,
-            gridcolor="lightgray",
-            zerolinecolor = "black"
-            
-        ),
-        title_font=dict(size=GLOBAL_FONT_SIZE * 1.1, color=GLOBAL_FONT_COLOR, family=GLOBAL_FONT_FAMILY),
-        legend_title_text=None,
-        legend_font=dict(size=GLOBAL_FONT_SIZE * 0.9, color=GLOBAL_FONT_COLOR, family=GLOBAL_FONT_FAMILY),
-        annotations=[dict(
-            x=1,
-            y=1.05,
-            xref="paper",
-            yref="paper",
-            text="PattPet",
-            showarrow=False,
-            font=dict(size=GLOBAL_FONT_SIZE * 0.7, color="grey", family=GLOBAL_FONT_FAMILY),
-            align="right",
-            borderpad=4
-            )
-        ],
-        legend=dict(
-            orientation="h",
-            yanchor="bottom",
-            y=-0.2,
-            xanchor="center",
-            x=0.5
+# The heatmap section (its widgets and figure) runs as a fragment, so
+# colorscale and reverse toggles rerun only this block instead of the
+# whole script.
+@st.fragment
+def render_heatmap(final_df, selected_day_input, selected_resolution_entsoe_code, resolution_text):
+    st.subheader(f"Day-Ahead Electricity Prices for {selected_day_input.strftime('%Y-%m-%d')} ({resolution_text} resolution)")
+
+    # --- Colorscale Selection and Reverse button ---
+
+    col_cs, col_rev = st.columns([2, 1])
+    with col_cs:
+        selected_colorscale_name = st.selectbox(
+            "Select heatmap colorscale:",
+            options=COLORSCALE_OPTIONS,
+            index=0, # Default to "Default"
+            key="colorscale_selector"
         )
+    with col_rev:
+        st.write("") # Space for alignment
+        reverse_colorscale = st.checkbox("Reverse Colors", key="reverse_colorscale_checkbox")
+
+    # Rebuilding the Plotly figure is the expensive part of a rerun; skip
+    # it entirely when nothing feeding the figure has changed.
+    fig_key = (
+        selected_day_input.isoformat(),
+        tuple(final_df.columns),
+        _data_fingerprint(final_df),
+        selected_resolution_entsoe_code,
+        selected_colorscale_name,
+        reverse_colorscale,
+        st.session_state.cache_buster,
     )
-
-    st.plotly_chart(fig_line, use_container_width=True)
-
-    # --- HEATMAP SECTION (now second, with checkbox to show) ---
-    st.markdown("---") 
-    show_heatmap = st.checkbox("Show Heatmap", value=False, key="heatmap_checkbox")
-
-    if show_heatmap:
-        st.subheader(f"Day-Ahead Electricity Prices for {selected_day_input.strftime('%Y-%m-%d')} ({resolution_text} resolution)")
-
-        # --- Colorscale Selection and Reverse button ---
-        colorscale_options = ["Default", "Picnic", "balance", "Temps", "Fall", "Tropic", "Portland", "Earth", "PRGn", "RdBu", "Viridis", "ice", "deep", "dense", "gray", "hot", "jet", "cividis", "RdBu", "YlGnBu", "YlOrRd", "haline"]
-        
-        col_cs, col_rev = st.columns([2, 1])
-        with col_cs:
-            selected_colorscale_name = st.selectbox(
-                "Select heatmap colorscale:",
-                options=colorscale_options,
-                index=0, # Default to "Default"
-                key="colorscale_selector"
-            )
-        with col_rev:
-            st.write("") # Space for alignment
-            reverse_colorscale = st.checkbox("Reverse Colors", key="reverse_colorscale_checkbox")
-
+    if st.session_state.get("heatmap_fig_key") == fig_key and "heatmap_fig_json" in st.session_state:
+        fig_json = st.session_state["heatmap_fig_json"]
+    else:
         # Prepare the final colorscale to be used
         actual_colorscale_for_plotly = ""
-        
+    
         # Define the custom colors for the "Default" scale
         GREEN = '#6AA84F'
         NEUTRAL = '#E1EDDB'
@@ -325,84 +450,62 @@ if not final_df.empty:
 
 
         # Prepare data for heatmap
-        spreads = (final_df.max() - final_df.min()).round(1)
-        new_labels = [f"{country}<br>{spread}" for country, spread in zip(final_df.columns, spreads)]
-        text_labels = final_df.round(1).astype(str).values
-        
-        # Y-axis labels for heatmap (for hover and all points)
-        heatmap_y_labels = final_df.index.strftime('%H:%M').tolist()
-        
-        # Tick values and ticktext for Y-axis (dynamically by resolution)
+        # One pass over the value matrix gives the per-country extremes; the
+        # global zmin/zmax and the spreads are derived from the same reductions.
+        # nan-aware reductions, because reindexing may have introduced NaN rows.
+        # float32 is ample for display precision and halves the z payload
+        # shipped to the browser; the data table keeps the full float64 frame.
+        vals = final_df.to_numpy(dtype=np.float32)
+        col_min = np.nanmin(vals, axis=0)
+        col_max = np.nanmax(vals, axis=0)
+        spreads = np.round(col_max - col_min, 1)
+        new_labels = np.char.add(
+            np.char.add(final_df.columns.to_numpy(dtype=str), "<br>"),
+            spreads.astype(str)
+        )
+
+        # In-cell text display by resolution (Plotly formats the y-axis ticks
+        # natively from the datetime index, so no label arrays are needed)
         if selected_resolution_entsoe_code == "PT15M":
-            y_axis_tick_vals_display = [h for i, h in enumerate(heatmap_y_labels) if i % 4 == 0]
             # For 15-minute resolution, text in cells will not be displayed
             heatmap_show_text = False
             heatmap_text_font_size = None # Not relevant when text is not displayed
         else:
-            y_axis_tick_vals_display = [f"{h:02d}:00" for h in range(24)]
-            heatmap_show_text = True
-            heatmap_text_font_size = GLOBAL_FONT_SIZE * 0.9 # Standard font size for hourly resolution
-
-        # --- Logic for dynamic zmin, zmax, zmid for the chosen colorscale ---
-        data_zmin = final_df.values.min()
-        data_zmax = final_df.values.max()
-
-        plot_zmin = data_zmin
-        plot_zmax = data_zmax
-        plot_zmid = None
+            # In-cell text spawns one SVG node per cell, which gets sluggish in
+            # the browser for wide country selections; hover still shows values
+            heatmap_show_text = len(final_df.columns) <= 15
+            heatmap_text_font_size = GLOBAL_FONT_SIZE * 0.9 if heatmap_show_text else None
 
+        # --- Dynamic zmin, zmax, zmid for the chosen colorscale ---
         # Determine if the colorscale is diverging for appropriate zmid setting
         # We need to consider the base name of the colorscale, ignoring "_r"
         base_colorscale_name = selected_colorscale_name.replace("_r", "")
-        diverging_scales_list = ["Default", "Picnic", "PRGn", "RdBu", "balance", "Temps"] 
-        is_diverging_scale = base_colorscale_name in diverging_scales_list
-        
-        if is_diverging_scale: 
-            if data_zmin < 0 and data_zmax > 0:
-                max_abs_val = max(abs(data_zmin), abs(data_zmax))
-                plot_zmin = -max_abs_val
-                plot_zmax = max_abs_val
-                plot_zmid = 0
-            elif data_zmin >= 0: # All positive, start from 0, zmid not strictly for centering
-                plot_zmin = 0
-                plot_zmax = data_zmax
-                plot_zmid = None 
-            elif data_zmax <= 0: # All negative, end at 0, zmid not strictly for centering
-                plot_zmin = data_zmin
-                plot_zmax = 0
-                plot_zmid = None
-        else: # For sequential colorscales (Fall, Tropic, Portland, Earth, Viridis)
-            if data_zmin >= 0: # All positive
-                plot_zmin = 0 # Start from 0 for better visualization
-                plot_zmax = data_zmax
-            elif data_zmax <= 0: # All negative
-                plot_zmin = data_zmin
-                plot_zmax = 0 # End at 0
-            else: # Mixed, even though a sequential scale is not ideal for mixed data, retain range
-                plot_zmin = data_zmin
-                plot_zmax = data_zmax
-            plot_zmid = None
+        is_diverging_scale = base_colorscale_name in DIVERGING_SCALES
+
+        plot_zmin, plot_zmax, plot_zmid = _compute_zrange(
+            col_min.min(), col_max.max(), is_diverging_scale
+        )
 
 
         fig = go.Figure(
             data=go.Heatmap(
-                z=final_df.values,
+                z=vals,
                 x=final_df.columns,
-                y=heatmap_y_labels, # All time points for detailed hover
+                y=final_df.index, # Native datetimes; ticks and hover are formatted client-side
                 colorscale=actual_colorscale_for_plotly, # Use the user-selected colorscale (or custom default)
                 zmin=plot_zmin, # Dynamically set zmin for color mapping
                 zmax=plot_zmax, # Dynamically set zmax for color mapping
                 zmid=plot_zmid, # Dynamically set zmid for color mapping
                 colorbar_title="price <br>[€/MWh]",
                 colorbar=dict(
-                    title_font=dict(color=GLOBAL_FONT_COLOR, size=GLOBAL_FONT_SIZE, family=GLOBAL_FONT_FAMILY),
-                    tickfont=dict(color=GLOBAL_FONT_COLOR, size=GLOBAL_FONT_SIZE * 0.9, family=GLOBAL_FONT_FAMILY)
+                    title_font=FONT_BASE,
+                    tickfont=FONT_SMALL
                 ),
-                # Conditional display of text in the heatmap
-                text=text_labels if heatmap_show_text else None,
-                texttemplate="%{text}" if heatmap_show_text else None,
+                # Conditional display of text in the heatmap; Plotly formats the
+                # z values client-side, so no parallel string array is shipped
+                texttemplate="%{z:.1f}" if heatmap_show_text else None,
                 textfont=dict(size=heatmap_text_font_size, family=GLOBAL_FONT_FAMILY) if heatmap_show_text else None,
-                hoverinfo="z+x+y"
+                hovertemplate="%{x}<br>%{y|%H:%M}<br>%{z:.2f} €/MWh<extra></extra>"
             )
         )
 
@@ -423,37 +526,148 @@ if not final_df.empty:
                 tickvals=final_df.columns,
                 ticktext=new_labels,
                 title="Country (bidding zone) / Spread [€/MWh]",
-                title_font=dict(color=GLOBAL_FONT_COLOR, size=GLOBAL_FONT_SIZE * 1.1, family=GLOBAL_FONT_FAMILY),
-                tickfont=dict(color=GLOBAL_FONT_COLOR, size=GLOBAL_FONT_SIZE, family=GLOBAL_FONT_FAMILY),
+                title_font=FONT_LARGE,
+                tickfont=FONT_BASE,
                 linecolor=GLOBAL_FONT_COLOR,
                 gridcolor="lightgray"
             ),
             yaxis=dict(
                 autorange="reversed",
-                tickmode='array',
-                tickvals=y_axis_tick_vals_display, # Use dynamic tick marks
-                ticktext=y_axis_tick_vals_display,
+                tickformat='%H:%M',
+                dtick=3600000, # One tick per hour (in ms), regardless of data resolution
                 ticklabelposition="outside right",
-                tickfont=dict(color=GLOBAL_FONT_COLOR, size=GLOBAL_FONT_SIZE, family=GLOBAL_FONT_FAMILY),
+                tickfont=FONT_BASE,
                 linecolor=GLOBAL_FONT_COLOR,
                 gridcolor="lightgray"
             ),
-            font=dict(family=GLOBAL_FONT_FAMILY, size=GLOBAL_FONT_SIZE, color=GLOBAL_FONT_COLOR),
-            annotations=[dict(
-                x=1,
-                y=1.05,
-                xref="paper",
-                yref="paper",
-                text="PattPet",
-                showarrow=False,
-                font=dict(size=GLOBAL_FONT_SIZE * 0.7, color="grey", family=GLOBAL_FONT_FAMILY),
-                align="right",
-                borderpad=4
-                )
-            ]
+            font=FONT_BASE,
+            annotations=WATERMARK_ANNOTATIONS
         )
-        
-        st.plotly_chart(fig, use_container_width=True)
+    
+
+        # Serialize once while building; reruns that hit the fingerprint reuse
+        # the JSON and skip Plotly's Python-level conversion walk entirely
+        # (pio.to_json picks the orjson encoder automatically when installed)
+        fig_json = pio.to_json(fig)
+        st.session_state["heatmap_fig_key"] = fig_key
+        st.session_state["heatmap_fig_json"] = fig_json
+
+    components.html(
+        f"""
+        <div id="heatmap" style="width:100%;height:800px;"></div>
+        <script src="https://cdn.plot.ly/plotly-3.0.1.min.js"></script>
+        <script>
+            var fig = {fig_json};
+            Plotly.newPlot("heatmap", fig.data, fig.layout, {{responsive: true}});
+        </script>
+        """,
+        height=820,
+    )
+
+
+final_df = pd.DataFrame() # Initialize an empty DataFrame
+failed_countries = []
+messages_from_fetch = []
+
+# Single status box for all data loading
+with st.status(f"Loading {resolution_text} day-ahead prices for {selected_day_input.strftime('%Y-%m-%d')}...", expanded=False) as status:
+    # Call the cached function
+    final_df, failed_countries, messages_from_fetch = get_entsoe_data(
+        selected_day_input, 
+        selected_countries, 
+        selected_resolution_entsoe_code, 
+        st.session_state.cache_buster
+    )
+
+    # Display individual messages from the fetching process
+    for msg in messages_from_fetch:
+        status.write(msg)
+    
+    # Update the final state of the status box
+    if failed_countries:
+        status.update(label=f"Data loading completed with issues for {len(failed_countries)} countries. ⚠️", state="error", expanded=True)
+    else:
+        status.update(label=f"Data loading completed for all selected countries. ✅", state="complete", expanded=False)
+
+# After data loading is complete (or errors displayed via status box), proceed with visualization
+if not final_df.empty:
+    # --- LINE CHART SECTION (DEFAULT ON, NO CHECKBOX) ---
+    st.markdown("---") 
+    st.subheader(f"Day-Ahead Price Line Chart ({resolution_text} resolution)")
+
+    # Same replot-skipping pattern as the heatmap: reuse the stored figure
+    # when nothing feeding the line chart has changed
+    line_fig_key = (
+        selected_day_input.isoformat(),
+        tuple(final_df.columns),
+        _data_fingerprint(final_df),
+        selected_resolution_entsoe_code,
+        st.session_state.cache_buster,
+    )
+    if st.session_state.get("line_fig_key") == line_fig_key and "line_fig" in st.session_state:
+        fig_line = st.session_state["line_fig"]
+    else:
+        # One WebGL trace per country straight from the wide frame; no melt into
+        # long form and no Plotly Express grouping pass needed
+        fig_line = go.Figure()
+        for country in final_df.columns:
+            fig_line.add_trace(go.Scattergl(
+                x=final_df.index,
+                y=final_df[country].to_numpy(copy=False),
+                name=country,
+                mode='lines',
+                line=dict(shape='hv', width=2.2),
+                hovertemplate='<b>Country: %{fullData.name}</b><br>Time: %{x|%H:%M}<br>Price: %{y:.2f} €/MWh<extra></extra>'
+            ))
+
+        fig_line.update_layout(
+            title=f"Day-Ahead Electricity Price Curves for {selected_day_input.strftime('%Y-%m-%d')} ({'15 min' if selected_resolution_entsoe_code == 'PT15M' else 'hourly'})",
+            height=600,
+            hovermode='x unified', # Setting for "table of all values"
+            font=FONT_SMALL,
+            plot_bgcolor='white',
+            paper_bgcolor='white',
+            xaxis=dict(
+                title_font=FONT_AXIS_TITLE,
+                tickfont=FONT_SMALL,
+                linecolor=GLOBAL_FONT_COLOR,
+                gridcolor="lightgray",
+                title = None, # Remove X-axis title "Time", it's clear enough
+            
+            ),
+            yaxis=dict(
+                title="Price [€/MWh]",
+                title_font=FONT_AXIS_TITLE,
+                tickfont=FONT_SMALL,
+                linecolor=GLOBAL_FONT_COLOR,
+                gridcolor="lightgray",
+                zerolinecolor = "black"
+
+            ),
+            title_font=FONT_LARGE,
+            legend_title_text=None,
+            legend_font=FONT_SMALL,
+            annotations=WATERMARK_ANNOTATIONS,
+            legend=dict(
+                orientation="h",
+                yanchor="bottom",
+                y=-0.2,
+                xanchor="center",
+                x=0.5
+            )
+        )
+
+        st.session_state["line_fig_key"] = line_fig_key
+        st.session_state["line_fig"] = fig_line
+
+    st.plotly_chart(fig_line, use_container_width=True)
+
+    # --- HEATMAP SECTION (now second, with checkbox to show) ---
+    st.markdown("---") 
+    show_heatmap = st.checkbox("Show Heatmap", value=False, key="heatmap_checkbox")
+
+    if show_heatmap:
+        render_heatmap(final_df, selected_day_input, selected_resolution_entsoe_code, resolution_text)
     
     # --- DATA TABLE SECTION ---
     st.markdown("---") # Another visual separator